@@ -1,41 +1,149 @@
-import json
+import orjson
 import os
-import stripe
 import boto3
-import uuid
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from botocore.config import Config
+import string
 import time
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 
 # --- Environment Variables ---
-stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
+STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
 DONATION_TABLE_NAME = os.environ.get('DONATION_TABLE_NAME', 'DonationRecords')
 PRICE_CONFIG_TABLE_NAME = os.environ.get('PRICE_CONFIG_TABLE_NAME', 'EventPriceConfig')
 FRONTEND_BASE_URL = os.environ.get('FRONTEND_BASE_URL', 'http://localhost:3000')
 
 # --- AWS Service Clients ---
-dynamodb = boto3.resource('dynamodb')
-donation_table = dynamodb.Table(DONATION_TABLE_NAME)
-price_table = dynamodb.Table(PRICE_CONFIG_TABLE_NAME)
+# Low-level client with TCP keep-alive so warm invocations reuse the pooled connection
+ddb_config = Config(
+    tcp_keepalive=True,
+    retries={'mode': 'standard', 'max_attempts': 3},
+    connect_timeout=1,
+    read_timeout=3
+)
+ddb = boto3.client('dynamodb', config=ddb_config)
 PRICE_CONFIG_ID = 'current_event_price'
 
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+def to_dynamodb(data):
+    """Marshals a plain dict into DynamoDB attribute values."""
+    return {k: _serializer.serialize(v) for k, v in data.items()}
+
+def from_dynamodb(item):
+    """Unmarshals a DynamoDB item into a plain dict (numbers come back as Decimal)."""
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+# --- Donation ID alphabet ---
+# The donationId is also the ticket's verification code, so it stays short and unambiguous to read out.
+_ALPHABET = (string.ascii_uppercase + '23456789').encode()
+_ALPHABET_LEN = len(_ALPHABET)
+_UNBIASED_LIMIT = 256 - (256 % _ALPHABET_LEN) # Bytes at or above this would skew the modulo
+
+def generate_short_id(length=7):
+    """Generates a short, human-readable, unique ID from the OS CSPRNG."""
+    chars = bytearray()
+    while len(chars) < length:
+        chars.extend(_ALPHABET[b % _ALPHABET_LEN] for b in os.urandom(length) if b < _UNBIASED_LIMIT)
+    return chars[:length].decode()
+
+# --- Static responses (built once per container) ---
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS'
+}
+OPTIONS_RESPONSE = { 'statusCode': 200, 'headers': CORS_HEADERS, 'body': '' }
+
+# --- Stripe SDK (imported on first use; OPTIONS preflights never load it) ---
+_stripe = None
+
+def _get_stripe():
+    """Imports and configures the Stripe SDK once per container."""
+    global _stripe
+    if _stripe is None:
+        import stripe
+        stripe.api_key = STRIPE_SECRET_KEY
+        _stripe = stripe
+    return _stripe
+
+# --- Stripe Price IDs for fixed-price events, keyed by (priceInCents, eventName) ---
+# The Price is found in Stripe by a deterministic lookup_key, so cold starts reuse the same
+# Price instead of creating a new Product/Price pair. The dict saves the lookup on warm calls.
+_STRIPE_PRICE_CACHE = {}
+
+def get_stripe_price_id(stripe, amount_in_cents, product_name, product_description):
+    """Returns a reusable Stripe Price ID for a fixed-price event, creating it only if Stripe has none."""
+    key = (amount_in_cents, product_name)
+    price_id = _STRIPE_PRICE_CACHE.get(key)
+    if not price_id:
+        lookup_key = f"event-{amount_in_cents}-{product_name}"[:200] # Stripe caps lookup keys at 200 chars
+        prices = stripe.Price.list(lookup_keys=[lookup_key], active=True, limit=1).data
+        if prices:
+            price_id = prices[0].id
+        else:
+            product = stripe.Product.create(name=product_name, description=product_description)
+            price_id = stripe.Price.create(
+                currency='eur',
+                unit_amount=amount_in_cents,
+                product=product.id,
+                lookup_key=lookup_key,
+                transfer_lookup_key=True # Two cold starts racing here must not fail on the second create
+            ).id
+        _STRIPE_PRICE_CACHE[key] = price_id
+    return price_id
+
+# --- Warm-container cache for the fixed-price config ---
+# set_event_price / unset-price-event changes become visible once the entry expires.
+PRICE_CACHE_TTL_SECONDS = 30
+_PRICE_CACHE = {'item': None, 'expires_at': 0}
+
+# Runs the price lookup on a cache miss while the handler parses and validates the request
+_executor = ThreadPoolExecutor(max_workers=2)
+
+def price_cache_is_fresh():
+    return time.time() < _PRICE_CACHE['expires_at']
+
+def get_price_config():
+    """Returns the fixed-price config item (or None), served from memory while fresh."""
+    if price_cache_is_fresh():
+        return _PRICE_CACHE['item']
+    try:
+        item = ddb.get_item(
+            TableName=PRICE_CONFIG_TABLE_NAME,
+            Key={'configId': {'S': PRICE_CONFIG_ID}}
+        ).get('Item')
+        price_config = from_dynamodb(item) if item else None
+    except Exception:
+        return None # If table/item doesn't exist, treat as no config (not cached)
+    _PRICE_CACHE['item'] = price_config
+    _PRICE_CACHE['expires_at'] = time.time() + PRICE_CACHE_TTL_SECONDS
+    return price_config
+
+# --- Warm-up (runs once per cold start, during init) ---
+# Priming the price cache loads the DynamoDB service model and opens the pooled TLS connection.
+get_price_config()
+
 def lambda_handler(event, context):
-    cors_headers = {
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type',
-        'Access-Control-Allow-Methods': 'POST, OPTIONS'
-    }
     if event.get('httpMethod') == 'OPTIONS':
-        return { 'statusCode': 200, 'headers': cors_headers, 'body': '' }
+        return OPTIONS_RESPONSE
 
     try:
-        body = json.loads(event.get('body', '{}'))
+        # --- Start the fixed-price lookup first so it overlaps request parsing ---
+        price_future = None if price_cache_is_fresh() else _executor.submit(get_price_config)
+
+        body = orjson.loads(event.get('body', '{}'))
         user_email = body.get('email')
+        if not user_email:
+            raise ValueError("Email is required.")
+
+        # First call in a container imports the Stripe SDK while the price read is in flight
+        stripe = _get_stripe()
 
         # --- Determine Amount: Check for a fixed price first ---
-        try:
-            price_config = price_table.get_item(Key={'configId': PRICE_CONFIG_ID}).get('Item')
-        except Exception:
-            price_config = None # If table/item doesn't exist, treat as no config
+        price_config = price_future.result() if price_future else get_price_config()
 
         if price_config:
             # A fixed price is set, use it
@@ -51,21 +159,25 @@ def lambda_handler(event, context):
         # --- Validation ---
         if not isinstance(donation_amount, int) or donation_amount < 100:
             raise ValueError("Invalid amount. Must be at least 1 EUR.")
-        if not user_email:
-            raise ValueError("Email is required.")
 
         # --- Create Stripe Checkout Session ---
-        donation_id = str(uuid.uuid4())
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
+        donation_id = generate_short_id()
+        if price_config:
+            # Fixed-price tickets reuse a cached Stripe Price
+            price_id = get_stripe_price_id(stripe, donation_amount, product_name, product_description)
+            line_item = {'price': price_id, 'quantity': 1}
+        else:
+            line_item = {
                 'price_data': {
                     'currency': 'eur',
                     'unit_amount': donation_amount,
                     'product_data': { 'name': product_name, 'description': product_description },
                 },
                 'quantity': 1,
-            }],
+            }
+        checkout_session = stripe.checkout.Session.create(
+            payment_method_types=['card'],
+            line_items=[line_item],
             mode='payment',
             success_url=f'{FRONTEND_BASE_URL}/success?session_id={{CHECKOUT_SESSION_ID}}',
             cancel_url=f'{FRONTEND_BASE_URL}?canceled=true',
@@ -74,29 +186,41 @@ def lambda_handler(event, context):
         )
 
         # --- Save initial record to DynamoDB ---
-        item_to_save = {
-            'donationId': donation_id,
-            'checkoutSessionId': checkout_session.id,
-            'amount': donation_amount,
-            'currency': 'eur',
-            'status': 'pending',
-            'payerEmail': user_email,
-            'timestamp': int(time.time())
+        # The condition makes the write create-only, so a retry can never overwrite an existing record.
+        # The ID is already in the Checkout Session metadata, so a collision fails the request
+        # instead of silently switching to a new ID the webhook would not find.
+        update_expression = "SET checkoutSessionId = :c, amount = :a, currency = :cu, #s = :st, payerEmail = :pe, creationTime = :ct"
+        attribute_values = {
+            ':c': checkout_session.id,
+            ':a': donation_amount,
+            ':cu': 'eur',
+            ':st': 'pending',
+            ':pe': user_email,
+            ':ct': int(time.time()) # Replaced by the purchase time when the webhook completes the donation
         }
         if price_config: # If it was a fixed-price event, add the event name
-            item_to_save['eventName'] = product_name
-            
-        donation_table.put_item(Item=item_to_save)
+            update_expression += ", eventName = :en"
+            attribute_values[':en'] = product_name
+
+        ddb.update_item(
+            TableName=DONATION_TABLE_NAME,
+            Key={'donationId': {'S': donation_id}},
+            UpdateExpression=update_expression,
+            ConditionExpression='attribute_not_exists(donationId)',
+            ExpressionAttributeNames={'#s': 'status'}, # 'status' is a reserved word
+            ExpressionAttributeValues=to_dynamodb(attribute_values),
+            ReturnValues='NONE'
+        )
 
         return {
             'statusCode': 200,
-            'headers': cors_headers,
-            'body': json.dumps({'session_url': checkout_session.url})
+            'headers': CORS_HEADERS,
+            'body': orjson.dumps({'session_url': checkout_session.url}).decode()
         }
 
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': cors_headers,
-            'body': json.dumps({'message': f'Internal server error: {str(e)}'})
+            'headers': CORS_HEADERS,
+            'body': orjson.dumps({'message': f'Internal server error: {str(e)}'}).decode()
         }
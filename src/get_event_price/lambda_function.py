@@ -1,66 +1,100 @@
-import json
+import orjson
 import os
 import boto3
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
+import time
 from decimal import Decimal
 
-# Helper class to convert a DynamoDB item to JSON.
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, Decimal):
-            if o % 1 == 0:
-                return int(o)
-            else:
-                return float(o)
-        return super(DecimalEncoder, self).default(o)
+def decimal_default(o):
+    """orjson fallback for DynamoDB's Decimal numbers: whole values become int, the rest float."""
+    if isinstance(o, Decimal):
+        return int(o) if o % 1 == 0 else float(o)
+    raise TypeError
 
-# Initialize DynamoDB client
-dynamodb = boto3.resource('dynamodb')
+# Initialize a low-level DynamoDB client with TCP keep-alive so warm invocations reuse the pooled connection
+ddb_config = Config(
+    tcp_keepalive=True,
+    retries={'mode': 'standard', 'max_attempts': 3},
+    connect_timeout=1,
+    read_timeout=3
+)
+ddb = boto3.client('dynamodb', config=ddb_config)
 TABLE_NAME = os.environ.get('PRICE_CONFIG_TABLE_NAME', 'EventPriceConfig')
-price_table = dynamodb.Table(TABLE_NAME)
 PRICE_CONFIG_ID = 'current_event_price'
 
+_deserializer = TypeDeserializer()
+
+def from_dynamodb(item):
+    """Unmarshals a DynamoDB item into a plain dict (numbers come back as Decimal)."""
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+# --- Static responses (built once per container) ---
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'GET,OPTIONS'
+}
+OPTIONS_RESPONSE = {'statusCode': 200, 'headers': CORS_HEADERS, 'body': ''}
+# No item means no price has been set yet.
+NO_PRICE_RESPONSE = {
+    'statusCode': 404,
+    'headers': CORS_HEADERS,
+    'body': orjson.dumps({'message': 'No fixed price has been set.'}).decode()
+}
+INTERNAL_ERROR_RESPONSE = {
+    'statusCode': 500,
+    'headers': CORS_HEADERS,
+    'body': orjson.dumps({'message': 'An internal error occurred.'}).decode()
+}
+
+# Warm containers serve the price from memory; changes show up once the entry expires.
+PRICE_CACHE_TTL_SECONDS = 30
+_PRICE_CACHE = {'item': None, 'expires_at': 0}
+
+def get_price_config():
+    """Returns the fixed-price config item (or None), served from memory while fresh."""
+    if time.time() < _PRICE_CACHE['expires_at']:
+        return _PRICE_CACHE['item']
+    response = ddb.get_item(
+        TableName=TABLE_NAME,
+        Key={'configId': {'S': PRICE_CONFIG_ID}}
+    )
+    item = from_dynamodb(response['Item']) if 'Item' in response else None
+    _PRICE_CACHE['item'] = item
+    _PRICE_CACHE['expires_at'] = time.time() + PRICE_CACHE_TTL_SECONDS
+    return item
+
+# --- Warm-up (runs once per cold start, during init) ---
+# Priming the price cache loads the DynamoDB service model and opens the pooled TLS connection.
+try:
+    get_price_config()
+except Exception:
+    pass
+
 def lambda_handler(event, context):
     """
     Handles GET requests to fetch the current fixed event price.
     This function should be publicly accessible.
     """
-    headers = {
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type',
-        'Access-Control-Allow-Methods': 'GET,OPTIONS'
-    }
-
     if event.get('httpMethod') == 'OPTIONS':
-        return {'statusCode': 200, 'headers': headers, 'body': ''}
+        return OPTIONS_RESPONSE
 
     try:
-        # --- Fetch from DynamoDB ---
-        response = price_table.get_item(
-            Key={'configId': PRICE_CONFIG_ID}
-        )
-        
-        item = response.get('Item')
+        # --- Fetch from cache or DynamoDB ---
+        item = get_price_config()
 
         if not item:
-            # If no item is found, it means no price has been set yet.
-            return {
-                'statusCode': 404,
-                'headers': headers,
-                'body': json.dumps({'message': 'No fixed price has been set.'})
-            }
+            return NO_PRICE_RESPONSE
 
         # --- Success Response ---
         return {
             'statusCode': 200,
-            'headers': headers,
-            # Use the custom encoder to handle the Decimal type from DynamoDB
-            'body': json.dumps(item, cls=DecimalEncoder)
+            'headers': CORS_HEADERS,
+            # decimal_default handles the Decimal type from DynamoDB
+            'body': orjson.dumps(item, default=decimal_default).decode()
         }
         
     except Exception as e:
         print(f"Internal Server Error: {e}")
-        return {
-            'statusCode': 500,
-            'headers': headers,
-            'body': json.dumps({'message': 'An internal error occurred.'})
-        }
+        return INTERNAL_ERROR_RESPONSE
@@ -1,56 +1,98 @@
-import json
+import orjson
+import logging
 import os
-import stripe
 import boto3
-import random
-import string
-from datetime import datetime, timedelta, time, timezone
-from decimal import Decimal
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
+import hmac
+import hashlib
+import time
+from datetime import datetime, timedelta, time as dt_time, timezone
 from botocore.exceptions import ClientError # For conditional update errors
 
-class DecimalEncoder(json.JSONEncoder):
-    """Helper to serialize Decimal types from DynamoDB to JSON."""
-    def default(self, o):
-        if isinstance(o, Decimal):
-            if o % 1 == 0:
-                return int(o)
-            else:
-                return float(o)
-        return super(DecimalEncoder, self).default(o)
-
 # --- AWS Service Clients ---
-stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
-dynamodb = boto3.resource('dynamodb')
-ses_client = boto3.client('ses', region_name='eu-central-1')
+# Low-level client with TCP keep-alive so warm invocations reuse the pooled connection
+ddb_config = Config(
+    tcp_keepalive=True,
+    retries={'mode': 'standard', 'max_attempts': 3},
+    connect_timeout=1,
+    read_timeout=3
+)
+ddb = boto3.client('dynamodb', config=ddb_config)
+sqs_client = boto3.client('sqs')
+
+# Lambda wires the root logger to CloudWatch; logger.exception records the traceback
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
 
 # --- Environment Variables ---
 DONATION_TABLE_NAME = os.environ.get('DONATION_TABLE_NAME', 'DonationRecords')
-FROM_EMAIL_ADDRESS = os.environ.get('FROM_EMAIL_ADDRESS')
-FALLBACK_FRONTEND_DOMAIN = os.environ.get('FRONTEND_BASE_URL', 'http://localhost:3000')
+EMAIL_QUEUE_URL = os.environ.get('EMAIL_QUEUE_URL')
+FRONTEND_BASE_URL = os.environ.get('FRONTEND_BASE_URL', 'http://localhost:3000')
+
+TICKET_WINDOW_SECONDS = 2 * 60 * 60
+
+_serializer = TypeSerializer()
 
-donation_table = dynamodb.Table(DONATION_TABLE_NAME)
+def to_dynamodb(data):
+    """Marshals a plain dict into DynamoDB attribute values."""
+    return {k: _serializer.serialize(v) for k, v in data.items()}
 
-def generate_short_id(length=7):
-    """Generates a short, human-readable, unique ID."""
-    characters = string.ascii_uppercase + '23456789'
-    short_id = ''.join(random.choices(characters, k=length))
-    return short_id
+# --- Warm-up (runs once per cold start, during init) ---
+# A throwaway read loads the DynamoDB service model and opens the pooled TLS connection
+# so the first webhook does not wait on it.
+try:
+    ddb.get_item(TableName=DONATION_TABLE_NAME, Key={'donationId': {'S': '__warmup__'}})
+except Exception:
+    pass
+
+# --- Stripe webhook signature verification ---
+# Same scheme as stripe.Webhook.construct_event, without building the SDK's object tree.
+SIGNATURE_TOLERANCE_SECONDS = 300
+
+def verify_stripe_signature(payload, sig_header, secret):
+    """
+    Verifies a Stripe-Signature header ("t=<ts>,v1=<sig>[,v1=<sig>...]") against the raw payload.
+    Raises ValueError if the header is malformed, the timestamp is outside the tolerance
+    or no v1 signature matches.
+    """
+    timestamp = None
+    signatures = []
+    for part in sig_header.split(','):
+        key, _, value = part.strip().partition('=')
+        if key == 't':
+            timestamp = value
+        elif key == 'v1':
+            signatures.append(value)
+
+    if not timestamp or not signatures:
+        raise ValueError("Unable to extract timestamp and signatures from header.")
+    if abs(time.time() - int(timestamp)) > SIGNATURE_TOLERANCE_SECONDS:
+        raise ValueError("Timestamp outside the tolerance zone.")
+
+    expected = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise ValueError("No signatures found matching the expected signature for payload.")
 
 def lambda_handler(event, context):
     """
     AWS Lambda function to handle Stripe webhook events.
-    Processes 'checkout.session.completed' to update DynamoDB and send a verification email.
+    Processes 'checkout.session.completed' to update DynamoDB and queue the verification email.
     """
     print("Stripe Webhook received!")
     
     payload = event.get('body')
-    sig_header = event.get('headers', {}).get('Stripe-Signature')
+    # REST APIs keep header case, HTTP APIs lowercase it, so match the name case-insensitively
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    sig_header = headers.get('stripe-signature')
+    if not sig_header or not payload:
+        print("Missing Stripe-Signature header or request body.")
+        return {'statusCode': 400}
 
     try:
-        stripe_event = stripe.Webhook.construct_event(
-            payload, sig_header, STRIPE_WEBHOOK_SECRET
-        )
+        verify_stripe_signature(payload, sig_header, STRIPE_WEBHOOK_SECRET)
+        stripe_event = orjson.loads(payload)
     except Exception as e:
         print(f"Error verifying webhook signature: {e}")
         return {'statusCode': 400}
@@ -58,102 +100,75 @@ def lambda_handler(event, context):
     if stripe_event['type'] == 'checkout.session.completed':
         session = stripe_event['data']['object']
         checkout_session_id = session.get('id')
-        customer_email = session.get('customer_details', {}).get('email')
+        customer_details = session.get('customer_details') or {}
+        customer_email = customer_details.get('email')
         amount_total = session.get('amount_total', 0) / 100
 
         print(f"Checkout Session Completed: {checkout_session_id}")
 
         try:
-            # --- THIS IS THE FIX: Generate a short, human-readable verification ID ---
-            verification_id = generate_short_id()
-            
             now_utc = datetime.now(timezone.utc)
             creation_timestamp = int(now_utc.timestamp())
             
             tomorrow_utc = now_utc + timedelta(days=1)
-            expiration_datetime = datetime.combine(tomorrow_utc.date(), time(5, 0), tzinfo=timezone.utc)
+            expiration_datetime = datetime.combine(tomorrow_utc.date(), dt_time(5, 0), tzinfo=timezone.utc)
             expiration_timestamp = int(expiration_datetime.timestamp())
+            # Tickets are valid until 5 AM UTC tomorrow or two hours after purchase, whichever comes first.
+            # Storing the cutoff lets validate_ticket enforce both with a single comparison.
+            valid_until_timestamp = min(expiration_timestamp, creation_timestamp + TICKET_WINDOW_SECONDS)
+
+            # ProcessDonation stores our donationId (the table's partition key) in the session metadata
+            donation_id = (session.get('metadata') or {}).get('internal_donation_id')
+            if not donation_id:
+                print(f"Error: No internal donation ID in metadata for session ID: {checkout_session_id}.")
+                return {'statusCode': 200, 'body': orjson.dumps({'status': 'error', 'message': 'Donation record not found'}).decode()}
+
+            # ProcessDonation issues donationIds as short codes, so the key doubles as the ticket code
+            # and validate_ticket can redeem by key instead of querying the verificationId index.
+            verification_id = donation_id
+
+            # The condition folds the existence check and the duplicate-delivery guard into the write,
+            # so a redelivered event never regenerates the verification ID or re-sends the email.
+            try:
+                ddb.update_item(
+                    TableName=DONATION_TABLE_NAME,
+                    Key={'donationId': {'S': donation_id}},
+                    UpdateExpression="SET #status = :s, verificationId = :v, expirationTime = :e, validUntil = :vu, redeemed = :r, creationTime = :c, payerEmail = :pe, payerName = :pn",
+                    ConditionExpression="attribute_exists(donationId) AND #status <> :s",
+                    ExpressionAttributeNames={'#status': 'status'}, # 'status' is a DynamoDB reserved word
+                    ExpressionAttributeValues=to_dynamodb({
+                        ':s': 'completed',
+                        ':v': verification_id,
+                        ':e': expiration_timestamp,
+                        ':vu': valid_until_timestamp,
+                        ':r': False,
+                        ':c': creation_timestamp,
+                        ':pe': customer_email,
+                        ':pn': customer_details.get('name') or 'N/A'
+                    }),
+                    ReturnValues='NONE'
+                )
+            except ClientError as ce:
+                if ce.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    print(f"Donation {donation_id} is missing or already completed; skipping duplicate event.")
+                    return {'statusCode': 200, 'body': orjson.dumps({'status': 'success'}).decode()}
+                raise
 
-            response = donation_table.query(
-                IndexName='checkoutSessionId-index',
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('checkoutSessionId').eq(checkout_session_id)
-            )
-            
-            if not response['Items']:
-                print(f"Error: No matching donation record found for session ID: {checkout_session_id}.")
-                return {'statusCode': 200, 'body': json.dumps({'status': 'error', 'message': 'Donation record not found'})}
-
-            donation_item = response['Items'][0]
-            donation_id = donation_item['donationId']
-            dynamic_frontend_domain = donation_item.get('frontendDomain', FALLBACK_FRONTEND_DOMAIN)
-
-            donation_table.update_item(
-                Key={'donationId': donation_id},
-                UpdateExpression="SET #status = :s, #verificationId = :v, #expirationTime = :e, #redeemed = :r, #creationTime = :c, #payerEmail = :pe, #payerName = :pn",
-                ExpressionAttributeNames={
-                    '#status': 'status',
-                    '#verificationId': 'verificationId',
-                    '#expirationTime': 'expirationTime',
-                    '#redeemed': 'redeemed',
-                    '#creationTime': 'creationTime',
-                    '#payerEmail': 'payerEmail',
-                    '#payerName': 'payerName'
-                },
-                ExpressionAttributeValues={
-                    ':s': 'completed',
-                    ':v': verification_id,
-                    ':e': expiration_timestamp,
-                    ':r': False,
-                    ':c': creation_timestamp,
-                    ':pe': customer_email,
-                    ':pn': session.get('customer_details', {}).get('name', 'N/A')
-                }
-            )
             print(f"Successfully updated donation {donation_id} with short verification ID: {verification_id}.")
 
-            send_verification_email(customer_email, verification_id, amount_total, dynamic_frontend_domain)
-
-        except Exception as e:
-            print(f"Error during database update or email sending: {e}")
-            import traceback
-            traceback.print_exc()
-            return {'statusCode': 200, 'body': json.dumps({'status': 'error', 'message': 'Internal server error'})}
-
-    return {'statusCode': 200, 'body': json.dumps({'status': 'success'})}
-
+            # The email is sent by send_donation_email off the SQS queue, keeping SES off the webhook ack path
+            sqs_client.send_message(
+                QueueUrl=EMAIL_QUEUE_URL,
+                MessageBody=orjson.dumps({
+                    'to': customer_email,
+                    'verification_id': verification_id,
+                    'amount': amount_total,
+                    'domain': FRONTEND_BASE_URL
+                }).decode()
+            )
 
-def send_verification_email(to_email, verification_id, amount, frontend_domain):
-    """
-    Sends a verification email with a QR code and ticket details.
-    """
-    verification_url = f"{frontend_domain}/verify?id={verification_id}"
-    qr_code_url = f"https://api.qrserver.com/v1/create-qr-code/?size=250x250&data={verification_url}"
-
-    email_subject = "Your Donation Confirmation & Ticket"
-    email_body_html = f"""
-        <html>
-        <head></head>
-        <body style="font-family: Arial, sans-serif; text-align: center; color: #333;">
-            <h2>Thank You for Your Donation!</h2>
-            <p>We sincerely appreciate your generous donation of €{amount:.2f}.</p>
-            <p>This QR code is your verifiable ticket. It is valid until 5:00 AM tomorrow (UTC).</p>
-            <img src="{qr_code_url}" alt="Your Verification QR Code" style="max-width: 250px; height: auto; margin: 20px auto; display: block;">
-            <p>Verification ID: <strong>{verification_id}</strong></p>
-            <p>You can also verify your ticket directly by visiting: <a href="{verification_url}">{verification_url}</a></p>
-            <p style="font-size: 0.8em; color: #666;">Please keep this email safe. For any questions, contact support.</p>
-        </body>
-        </html>
-    """
+        except Exception:
+            logger.exception("Error during database update or email queueing")
+            return {'statusCode': 200, 'body': orjson.dumps({'status': 'error', 'message': 'Internal server error'}).decode()}
 
-    try:
-        response = ses_client.send_email(
-            Source=FROM_EMAIL_ADDRESS,
-            Destination={'ToAddresses': [to_email]},
-            Message={
-                'Subject': {'Data': email_subject},
-                'Body': {'Html': {'Data': email_body_html}}
-            }
-        )
-        print(f"Email sent successfully to {to_email}! Message ID: {response['MessageId']}")
-    except Exception as e:
-        print(f"Failed to send email to {to_email}: {e}")
+    return {'statusCode': 200, 'body': orjson.dumps({'status': 'success'}).decode()}
@@ -0,0 +1,99 @@
+import io
+import json
+import os
+import boto3
+import segno
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+# --- AWS Service Clients ---
+ses_client = boto3.client('ses', region_name='eu-central-1')
+
+# --- Environment Variables ---
+FROM_EMAIL_ADDRESS = os.environ.get('FROM_EMAIL_ADDRESS')
+
+# --- Email Content (static parts are built once per container) ---
+EMAIL_SUBJECT = "Your Donation Confirmation & Ticket"
+# The QR code travels inside the email as an inline attachment referenced by Content-ID,
+# so the ticket renders without any third-party image host.
+QR_CONTENT_ID = 'ticket-qr'
+EMAIL_BODY_TEMPLATE = """
+        <html>
+        <head></head>
+        <body style="font-family: Arial, sans-serif; text-align: center; color: #333;">
+            <h2>Thank You for Your Donation!</h2>
+            <p>We sincerely appreciate your generous donation of €{amount}.</p>
+            <p>This QR code is your verifiable ticket. It is valid until 5:00 AM tomorrow (UTC).</p>
+            <img src="cid:{cid}" alt="Your Verification QR Code" style="max-width: 250px; height: auto; margin: 20px auto; display: block;">
+            <p>Verification ID: <strong>{vid}</strong></p>
+            <p>You can also verify your ticket directly by visiting: <a href="{url}">{url}</a></p>
+            <p style="font-size: 0.8em; color: #666;">Please keep this email safe. For any questions, contact support.</p>
+        </body>
+        </html>
+    """
+
+def lambda_handler(event, context):
+    """
+    AWS Lambda function triggered by the email SQS queue.
+    Sends one verification email per message queued by handle_stripe_webhook.
+    Failed messages are reported back so SQS retries only those.
+    """
+    batch_item_failures = []
+
+    for record in event.get('Records', []):
+        try:
+            message = json.loads(record['body'])
+            send_verification_email(
+                message['to'],
+                message['verification_id'],
+                message['amount'],
+                message['domain']
+            )
+        except Exception as e:
+            print(f"Error processing email message {record.get('messageId')}: {e}")
+            batch_item_failures.append({'itemIdentifier': record['messageId']})
+
+    return {'batchItemFailures': batch_item_failures}
+
+
+def render_qr_png(data):
+    """Renders data as a QR code PNG (bytes)."""
+    buffer = io.BytesIO()
+    segno.make(data, error='m').save(buffer, kind='png', scale=5)
+    return buffer.getvalue()
+
+def send_verification_email(to_email, verification_id, amount, frontend_domain):
+    """
+    Sends a verification email with a QR code and ticket details.
+    """
+    verification_url = f"{frontend_domain}/verify?id={verification_id}"
+
+    email_body_html = EMAIL_BODY_TEMPLATE.format_map({
+        'amount': f'{amount:.2f}',
+        'cid': QR_CONTENT_ID,
+        'vid': verification_id,
+        'url': verification_url
+    })
+
+    message = MIMEMultipart('related')
+    message['Subject'] = EMAIL_SUBJECT
+    message['From'] = FROM_EMAIL_ADDRESS
+    message['To'] = to_email
+    message.attach(MIMEText(email_body_html, 'html', 'utf-8'))
+
+    qr_image = MIMEImage(render_qr_png(verification_url), 'png')
+    qr_image.add_header('Content-ID', f'<{QR_CONTENT_ID}>')
+    qr_image.add_header('Content-Disposition', 'inline', filename=f'{QR_CONTENT_ID}.png')
+    message.attach(qr_image)
+
+    try:
+        response = ses_client.send_raw_email(
+            Source=FROM_EMAIL_ADDRESS,
+            Destinations=[to_email],
+            RawMessage={'Data': message.as_bytes()}
+        )
+        print(f"Email sent successfully to {to_email}! Message ID: {response['MessageId']}")
+    except Exception as e:
+        print(f"Failed to send email to {to_email}: {e}")
+        raise # Let SQS redeliver the message
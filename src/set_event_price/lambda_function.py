@@ -1,25 +1,41 @@
-import json
+import orjson
 import os
 import boto3
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
 from decimal import Decimal
 
-dynamodb = boto3.resource('dynamodb')
+# Low-level client with TCP keep-alive so warm invocations reuse the pooled connection
+ddb_config = Config(
+    tcp_keepalive=True,
+    retries={'mode': 'standard', 'max_attempts': 3},
+    connect_timeout=1,
+    read_timeout=3
+)
+ddb = boto3.client('dynamodb', config=ddb_config)
 TABLE_NAME = os.environ.get('PRICE_CONFIG_TABLE_NAME', 'EventPriceConfig')
-price_table = dynamodb.Table(TABLE_NAME)
 PRICE_CONFIG_ID = 'current_event_price'
 
-def lambda_handler(event, context):
-    headers = {
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type,Authorization',
-        'Access-Control-Allow-Methods': 'POST,OPTIONS'
-    }
+_serializer = TypeSerializer()
+
+def to_dynamodb(data):
+    """Marshals a plain dict into DynamoDB attribute values."""
+    return {k: _serializer.serialize(v) for k, v in data.items()}
 
+# --- Static responses (built once per container) ---
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+    'Access-Control-Allow-Methods': 'POST,OPTIONS'
+}
+OPTIONS_RESPONSE = {'statusCode': 200, 'headers': CORS_HEADERS, 'body': ''}
+
+def lambda_handler(event, context):
     if event.get('httpMethod') == 'OPTIONS':
-        return {'statusCode': 200, 'headers': headers, 'body': ''}
+        return OPTIONS_RESPONSE
 
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = orjson.loads(event.get('body', '{}'))
         price_raw = body.get('price')
         event_name = body.get('eventName') # NEW: Get event name
 
@@ -39,30 +55,32 @@ def lambda_handler(event, context):
             raise ValueError("Price must be a positive number.")
 
         # --- Save to DynamoDB ---
-        price_table.put_item(
-            Item={
+        ddb.put_item(
+            TableName=TABLE_NAME,
+            Item=to_dynamodb({
                 'configId': PRICE_CONFIG_ID,
                 'priceInCents': Decimal(price_in_cents),
                 'eventName': event_name, # NEW: Save event name
                 'lastUpdated': Decimal(int(context.get_remaining_time_in_millis()))
-            }
+            }),
+            ReturnValues='NONE'
         )
         
         print(f"Successfully set event '{event_name}' to {price_in_cents} cents.")
 
         return {
             'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({
+            'headers': CORS_HEADERS,
+            'body': orjson.dumps({
                 'message': 'Price set successfully',
                 'price': price_in_cents,
                 'eventName': event_name
-            })
+            }).decode()
         }
 
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': headers,
-            'body': json.dumps({'message': f'An internal error occurred: {str(e)}'})
+            'headers': CORS_HEADERS,
+            'body': orjson.dumps({'message': f'An internal error occurred: {str(e)}'}).decode()
         }
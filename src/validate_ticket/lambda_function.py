@@ -1,176 +1,327 @@
-import json
+import orjson
+import logging
 import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 import boto3
-from decimal import Decimal
-from datetime import datetime, timedelta, timezone # Import for time calculations
+from botocore.config import Config
+from datetime import datetime, timezone # Only for human-readable log and reason text
 from botocore.exceptions import ClientError # For conditional update errors
 
-class DecimalEncoder(json.JSONEncoder):
-    """Helper to serialize Decimal types from DynamoDB to JSON."""
-    def default(self, o):
-        if isinstance(o, Decimal):
-            if o % 1 == 0:
-                return int(o)
-            else:
-                return float(o)
-        return super(DecimalEncoder, self).default(o)
-
-dynamodb = boto3.resource('dynamodb')
+# Low-level client with TCP keep-alive so warm invocations reuse the pooled connection
+ddb_config = Config(
+    tcp_keepalive=True,
+    retries={'mode': 'standard', 'max_attempts': 2}, # Scanner UI is waiting; fail fast rather than retry long
+    connect_timeout=1,
+    read_timeout=3,
+    max_pool_connections=10
+)
+ddb = boto3.client('dynamodb', config=ddb_config)
+
+# Lambda wires the root logger to CloudWatch; logger.exception records the traceback
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
 DONATION_TABLE_NAME = os.environ.get('DONATION_TABLE_NAME', 'DonationRecords')
-donation_table = dynamodb.Table(DONATION_TABLE_NAME)
+# Full event dumps and timing detail are only logged when LOG_LEVEL=DEBUG
+DEBUG = os.environ.get('LOG_LEVEL') == 'DEBUG'
 
-def lambda_handler(event, context):
-    print(f"Received validation request event: {json.dumps(event)}")
+def number_attr(item, name, default=None):
+    """Reads a DynamoDB number attribute ({'N': '1700000000'}) as an int."""
+    attr = item.get(name)
+    return int(attr['N']) if attr else default
+
+def parse_ticket(item):
+    """Pulls the scalar fields the scanner needs straight out of a raw DynamoDB item.
+
+    Every number stored on a donation (cents, epoch seconds) is an integer, so the
+    values are parsed with int() instead of going through TypeDeserializer's Decimals.
+    """
+    return {
+        'status': item.get('status', {}).get('S'),
+        'payerEmail': item.get('payerEmail', {}).get('S'),
+        'amount': number_attr(item, 'amount'),
+        'currency': item.get('currency', {}).get('S'),
+        'creationTime': number_attr(item, 'creationTime', 0),
+        'expirationTime': number_attr(item, 'expirationTime', 0),
+        'redeemed': item.get('redeemed', {}).get('BOOL', False),
+        'redeemedTime': number_attr(item, 'redeemedTime')
+    }
+
+# --- Static responses (built once per container) ---
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*', # Restrict this in production to your admin tool's domain
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization', # Include Authorization for API Key/Authorizer
+    'Access-Control-Allow-Methods': 'POST, OPTIONS'
+}
+OPTIONS_RESPONSE = {
+    'statusCode': 200,
+    'headers': CORS_HEADERS,
+    'body': ''
+}
+
+# The legacy GSI lookup is constant apart from the verification ID value, so its expression is defined once here
+VERIFICATION_INDEX_NAME = 'verificationId-index' # Can be dropped once legacy records have expired
+VERIFICATION_KEY_CONDITION = 'verificationId = :v'
+
+# Verification IDs are short alphanumeric codes; donations completed during the switch to
+# code-keyed records carry their UUID donationId instead, hence the '-' and the length cap.
+MAX_VERIFICATION_ID_LENGTH = 64
+
+def is_well_formed_id(verification_id):
+    """Rejects junk IDs locally so they never cost a DynamoDB round trip."""
+    return (
+        isinstance(verification_id, str)
+        and len(verification_id) <= MAX_VERIFICATION_ID_LENGTH
+        and verification_id.isascii()
+        and verification_id.replace('-', '').isalnum()
+    )
+
+# --- Redeemed-ticket cache ---
+# Scanners often submit the same QR code twice in a row. Redemption is permanent, so a
+# verificationId seen as redeemed can be answered from the warm container without DynamoDB.
+# Entries hold the ticket's invalid-ticket body so cached answers render like uncached ones.
+REDEEMED_CACHE_MAX_ENTRIES = 1024
+_REDEEMED_CACHE = OrderedDict()
+_REDEEMED_CACHE_LOCK = Lock() # Batch requests validate tickets on several threads
+
+def get_cached_redeemed_body(verification_id):
+    """Returns the cached body for a redeemed ticket, or None if it is not cached."""
+    with _REDEEMED_CACHE_LOCK:
+        body = _REDEEMED_CACHE.get(verification_id)
+        if body is not None:
+            _REDEEMED_CACHE.move_to_end(verification_id)
+        return body
+
+def remember_redeemed(verification_id, body):
+    with _REDEEMED_CACHE_LOCK:
+        _REDEEMED_CACHE[verification_id] = body
+        _REDEEMED_CACHE.move_to_end(verification_id)
+        while len(_REDEEMED_CACHE) > REDEEMED_CACHE_MAX_ENTRIES:
+            _REDEEMED_CACHE.popitem(last=False)
+
+# --- Batch validation ---
+# A scanner may submit several codes at once as verificationIds. Each ticket keeps its own
+# conditional update so one bad ticket does not block the rest; they run concurrently on
+# the pooled client (max_pool_connections matches the worker count).
+MAX_BATCH_SIZE = 25
+_executor = ThreadPoolExecutor(max_workers=10)
+
+# --- Warm-up (runs once per cold start, during init) ---
+# DescribeTable loads the DynamoDB service model and opens the pooled TLS connection
+# so the first request does not wait on it, without consuming read capacity.
+try:
+    ddb.describe_table(TableName=DONATION_TABLE_NAME)
+except Exception:
+    pass
+
+# --- Redemption rules ---
+# A ticket can be redeemed once, only when paid, before its expiration time and within
+# two hours of purchase. The webhook stores validUntil = min(expirationTime, creationTime + 2h)
+# so both time rules are one comparison. Records completed before validUntil existed fall
+# back to the separate checks; conditions cannot do arithmetic, so the window start is
+# passed in as :window_start (now - 2h).
+TWO_HOUR_WINDOW_SECONDS = 2 * 60 * 60
+REDEEM_CONDITION = (
+    "#s = :completed"
+    " AND (attribute_not_exists(redeemed) OR redeemed = :false_val)"
+    " AND (validUntil >= :now"
+    " OR (attribute_not_exists(validUntil) AND expirationTime >= :now AND creationTime >= :window_start))"
+)
+
+def redeem_ticket(donation_id, current_time_utc):
+    """Validates and redeems a ticket in one conditional UpdateItem.
+
+    The condition encodes every redemption rule, so there is no separate read and no window
+    between checking and redeeming. Returns (redeemed, raw pre-image item); the item is None
+    when no record exists under donation_id.
+    """
+    try:
+        response = ddb.update_item(
+            TableName=DONATION_TABLE_NAME,
+            Key={'donationId': {'S': donation_id}},
+            UpdateExpression="SET redeemed = :r, redeemedTime = :rt",
+            ConditionExpression=REDEEM_CONDITION,
+            ExpressionAttributeNames={'#s': 'status'},
+            ExpressionAttributeValues={
+                ':r': {'BOOL': True},
+                ':rt': {'N': str(current_time_utc)},
+                ':completed': {'S': 'completed'},
+                ':false_val': {'BOOL': False},
+                ':now': {'N': str(current_time_utc)},
+                ':window_start': {'N': str(current_time_utc - TWO_HOUR_WINDOW_SECONDS)}
+            },
+            ReturnValues='ALL_OLD',
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return True, response['Attributes']
+    except ClientError as ce:
+        if ce.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise # Re-raise other ClientErrors
+        # A missing key also fails the condition, but with no pre-image
+        return False, ce.response.get('Item')
+
+def invalid_ticket_reason(item, verification_id, current_time_utc):
+    """Works out which redemption rule a ticket failed, from its stored attributes."""
+    status = item['status']
+    expiration_time_utc_db = item['expirationTime']
+    two_hour_window_end_time = item['creationTime'] + TWO_HOUR_WINDOW_SECONDS
+
+    # 1. Check if status is 'completed'
+    if status != 'completed':
+        print(f"Ticket {verification_id} invalid: status is {status}")
+        return "Ticket status is not 'completed'. Payment might be pending or failed."
+
+    # 2. Check if already redeemed
+    if item['redeemed']:
+        redeemed_timestamp = item['redeemedTime']
+        redeemed_dt = datetime.fromtimestamp(redeemed_timestamp, tz=timezone.utc) if redeemed_timestamp else None
+        print(f"Ticket {verification_id} invalid: already redeemed.")
+        return f"Ticket has already been redeemed at {redeemed_dt.isoformat(timespec='seconds')}." if redeemed_dt else "Ticket has already been redeemed."
 
-    # Define CORS headers for the response
-    cors_headers = {
-        'Access-Control-Allow-Origin': '*', # Restrict this in production to your admin tool's domain
-        'Access-Control-Allow-Headers': 'Content-Type,Authorization', # Include Authorization for API Key/Authorizer
-        'Access-Control-Allow-Methods': 'POST, OPTIONS'
+    # 3. Check general expiration time (5 AM next day UTC)
+    if current_time_utc > expiration_time_utc_db:
+        print(f"Ticket {verification_id} invalid: expired at {expiration_time_utc_db}")
+        return "Ticket has expired (past 5 AM UTC next day)."
+
+    # 4. Check the 2-hour window
+    if current_time_utc > two_hour_window_end_time:
+        print(f"Ticket {verification_id} invalid: exceeded 2-hour window.")
+        if DEBUG:
+            print(f"Current: {current_time_utc}, 2hr-end: {two_hour_window_end_time}")
+        return "Ticket is no longer valid (exceeded 2-hour validation window from purchase)."
+
+    # All rules passed on the pre-image, so the record changed between the read and the write
+    print(f"Ticket {verification_id} invalid: concurrent redemption attempt.")
+    return "Ticket has already been redeemed by another process."
+
+def invalid_ticket_body(item, verification_id, reason):
+    """Builds the response for a ticket that failed validation.
+
+    Skips the internal fields of a redemption response but keeps everything the admin
+    page renders for a scanned ticket (payer, amount, purchase time, redeemed status).
+    """
+    return {
+        'valid': False,
+        'reason': reason,
+        'verificationId': verification_id,
+        'payerEmail': item['payerEmail'],
+        'amount': item['amount'],
+        'currency': item['currency'],
+        'creationTime': item['creationTime'],
+        'redeemed': item['redeemed'],
+        'redeemedTime': item['redeemedTime'],
+        'actionTaken': 'none'
+    }
+
+def validate_single_ticket(verification_id, current_time_utc):
+    """Validates and redeems one ticket. Returns (status_code, response body dict)."""
+    if not verification_id:
+        return 400, {'message': 'Verification ID is required.', 'valid': False, 'reason': 'Missing ID'}
+
+    if not is_well_formed_id(verification_id):
+        return 400, {'message': 'Verification ID is malformed.', 'valid': False, 'reason': 'Invalid ID'}
+
+    cached_body = get_cached_redeemed_body(verification_id)
+    if cached_body is not None:
+        print(f"Ticket {verification_id} invalid: already redeemed (cached).")
+        return 200, {**cached_body, 'reason': 'Already redeemed (cached)'}
+
+    # New donations use the verification code as their donationId, so try the key directly
+    donation_id = verification_id
+    redeemed, raw_item = redeem_ticket(donation_id, current_time_utc)
+
+    if raw_item is None:
+        # Legacy records have a UUID donationId; resolve it through the verificationId GSI
+        response = ddb.query(
+            TableName=DONATION_TABLE_NAME,
+            IndexName=VERIFICATION_INDEX_NAME,
+            KeyConditionExpression=VERIFICATION_KEY_CONDITION,
+            ExpressionAttributeValues={':v': {'S': verification_id}},
+            ProjectionExpression='donationId',
+            Select='SPECIFIC_ATTRIBUTES',
+            Limit=1 # verificationId is unique; never read past the first match
+        )
+        items = response.get('Items', [])
+        if items:
+            donation_id = items[0]['donationId']['S']
+            redeemed, raw_item = redeem_ticket(donation_id, current_time_utc)
+
+    if raw_item is None:
+        print(f"No donation record found for verification ID: {verification_id}")
+        return 404, {'message': 'Ticket not found.', 'valid': False, 'reason': 'Ticket not found'}
+
+    item = parse_ticket(raw_item)
+    if not redeemed:
+        # The pre-image tells us which rule failed
+        body = invalid_ticket_body(item, verification_id, invalid_ticket_reason(item, verification_id, current_time_utc))
+        if item['redeemed']:
+            remember_redeemed(verification_id, body)
+        return 200, body
+
+    print(f"Ticket {verification_id} successfully redeemed at {current_time_utc}.")
+    if DEBUG:
+        print(f"Redeemed at {datetime.fromtimestamp(current_time_utc, tz=timezone.utc).isoformat(timespec='seconds')}.")
+    redeemed_item = {**item, 'redeemed': True, 'redeemedTime': current_time_utc}
+    remember_redeemed(verification_id, invalid_ticket_body(redeemed_item, verification_id, "Ticket has already been redeemed."))
+
+    # Prepare response data, including all relevant details for the frontend
+    return 200, {
+        'valid': True,
+        'reason': "Ticket is valid and has been redeemed.",
+        'donationId': donation_id,
+        'verificationId': verification_id,
+        'status': item['status'], # Original status from DB ('completed')
+        'payerEmail': item['payerEmail'],
+        'amount': item['amount'],
+        'currency': item['currency'],
+        'creationTime': item['creationTime'], # Purchase time
+        'expirationTime': item['expirationTime'], # 5 AM next day expiration
+        'currentTime': current_time_utc,
+        'redeemed': True, # Redeemed by this call
+        'redeemedTime': current_time_utc,
+        'actionTaken': 'redeemed' # What action was taken by this Lambda call
     }
 
+def validate_batch_entry(verification_id, current_time_utc):
+    """Runs one ticket of a batch; a failure is reported in its result instead of failing the batch."""
+    try:
+        status_code, result = validate_single_ticket(verification_id, current_time_utc)
+    except Exception:
+        logger.exception(f"Error validating ticket {verification_id}")
+        status_code, result = 500, {'message': 'Internal server error.', 'valid': False, 'reason': 'Internal server error'}
+    return {**result, 'verificationId': verification_id, 'statusCode': status_code}
+
+def lambda_handler(event, context):
+    if DEBUG:
+        print(f"Received validation request event: {orjson.dumps(event).decode()}")
+
     # Handle CORS preflight request
     if event.get('httpMethod') == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': cors_headers,
-            'body': ''
-        }
+        return OPTIONS_RESPONSE
 
     try:
-        # Expecting verificationId in the request body for POST method
-        body = json.loads(event.get('body', '{}'))
-        verification_id = body.get('verificationId')
+        # Expecting verificationId (or a verificationIds list) in the request body for POST method
+        body = orjson.loads(event.get('body') or '{}')
 
-        if not verification_id:
-            return create_response(400, {'message': 'Verification ID is required.', 'valid': False, 'reason': 'Missing ID'}, cors_headers)
+        # One clock read per request, so the checks, redeemedTime and the response all agree
+        current_time_utc = int(time.time())
 
-        # Query DynamoDB using the verificationId (GSI)
-        response = donation_table.query(
-            IndexName='verificationId-index', # IMPORTANT: Ensure this GSI exists
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('verificationId').eq(verification_id)
-        )
+        verification_ids = body.get('verificationIds')
+        if verification_ids is not None:
+            if not isinstance(verification_ids, list) or not 0 < len(verification_ids) <= MAX_BATCH_SIZE:
+                return create_response(400, {'message': f'verificationIds must be a list of 1 to {MAX_BATCH_SIZE} IDs.', 'valid': False, 'reason': 'Invalid batch'}, CORS_HEADERS)
+            results = list(_executor.map(lambda vid: validate_batch_entry(vid, current_time_utc), verification_ids))
+            return create_response(200, {'results': results}, CORS_HEADERS)
 
-        items = response.get('Items', [])
-        
-        if not items:
-            print(f"No donation record found for verification ID: {verification_id}")
-            return create_response(404, {'message': 'Ticket not found.', 'valid': False, 'reason': 'Ticket not found'}, cors_headers)
-
-        # Assume verificationId is unique, take the first item
-        item = items[0] 
-        donation_id = item['donationId']
-        
-        # Retrieve all necessary fields for validation
-        status = item.get('status')
-        is_redeemed_db = item.get('redeemed', False) # Use 'redeemed' attribute
-        redeemed_time_db = item.get('redeemedTime') # Initialize here, might be None
-        expiration_time_utc_db = item.get('expirationTime', 0) # 8 AM next day expiration
-        creation_time_utc_db = item.get('creationTime', 0) # Purchase time
-
-        current_time_utc = int(datetime.now(timezone.utc).timestamp())
-        
-        # Calculate the end of the 2-hour window from the creation time
-        # FIX: Cast Decimal from DynamoDB to int for calculation
-        two_hour_window_end_time = int(creation_time_utc_db) + (2 * 60 * 60) # 2 hours in seconds
-
-        is_valid = True
-        reason = "Ticket is valid."
-        action_taken = "none" # To indicate if redemption happened in this call
-
-        # --- Validation Rules ---
-        # 1. Check if status is 'completed'
-        if status != 'completed':
-            is_valid = False
-            reason = "Ticket status is not 'completed'. Payment might be pending or failed."
-            print(f"Ticket {verification_id} invalid: status is {status}")
-
-        # 2. Check if already redeemed
-        elif is_redeemed_db: # Use the value from DB
-            is_valid = False
-            redeemed_timestamp = item.get('redeemedTime')
-            # FIX: Cast the Decimal timestamp from DynamoDB to an integer before using it
-            redeemed_dt = datetime.fromtimestamp(int(redeemed_timestamp), tz=timezone.utc) if redeemed_timestamp else None
-            reason = f"Ticket has already been redeemed at {redeemed_dt.strftime('%Y-%m-%d %H:%M:%S UTC')}." if redeemed_dt else "Ticket has already been redeemed."
-            print(f"Ticket {verification_id} invalid: already redeemed.")
-
-        # 3. Check general expiration time (8 AM next day UTC)
-        # FIX: Cast Decimal from DynamoDB to int for comparison
-        elif current_time_utc > int(expiration_time_utc_db):
-            is_valid = False
-            reason = "Ticket has expired (past 5 AM UTC next day)." # Note: Your SES email says 5 AM, Lambda calculates 5 AM, so updated message.
-            print(f"Ticket {verification_id} invalid: expired at {expiration_time_utc_db}")
-        
-        # 4. Check the 2-hour window
-        elif current_time_utc > two_hour_window_end_time:
-            is_valid = False
-            reason = "Ticket is no longer valid (exceeded 2-hour validation window from purchase)."
-            print(f"Ticket {verification_id} invalid: exceeded 2-hour window. Current: {current_time_utc}, 2hr-end: {two_hour_window_end_time}")
-
-        # --- Redemption Logic (if valid) ---
-        if is_valid:
-            try:
-                redeem_timestamp = int(datetime.now(timezone.utc).timestamp())
-                # Use ConditionExpression to ensure we only redeem if not already redeemed (to prevent race conditions)
-                donation_table.update_item(
-                    Key={'donationId': donation_id},
-                    UpdateExpression="SET redeemed = :r, redeemedTime = :rt",
-                    ConditionExpression="attribute_not_exists(redeemed) OR redeemed = :false_val", # Only update if 'redeemed' doesn't exist or is False
-                    ExpressionAttributeValues={
-                        ':r': True,
-                        ':rt': redeem_timestamp,
-                        ':false_val': False # Value for the condition check
-                    }
-                )
-                action_taken = "redeemed"
-                reason = "Ticket is valid and has been redeemed."
-                print(f"Ticket {verification_id} successfully redeemed at {datetime.fromtimestamp(redeem_timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}.")
-                
-                # Update the redeemed status for the response
-                is_redeemed_db = True
-                redeemed_time_db = redeem_timestamp
-
-            except ClientError as ce:
-                if ce.response['Error']['Code'] == 'ConditionalCheckFailedException':
-                    # This means the ticket was already redeemed by another concurrent request
-                    is_valid = False
-                    reason = "Ticket has already been redeemed by another process."
-                    action_taken = "failed_redeem_concurrent"
-                    print(f"Ticket {verification_id} invalid: concurrent redemption attempt.")
-                else:
-                    raise # Re-raise other ClientErrors
-            except Exception as update_error:
-                print(f"Error redeeming ticket {verification_id} in DynamoDB: {update_error}")
-                is_valid = False
-                reason = "Internal error during ticket redemption."
-                action_taken = "failed_redeem_general"
-
-
-        # Prepare response data, including all relevant details for the frontend
-        response_data = {
-            'valid': is_valid,
-            'reason': reason,
-            'donationId': donation_id,
-            'verificationId': verification_id,
-            'status': status, # Original status from DB ('completed')
-            'payerEmail': item.get('payerEmail'),
-            'amount': item.get('amount'),
-            'currency': item.get('currency'),
-            'creationTime': creation_time_utc_db,
-            'expirationTime': expiration_time_utc_db,
-            'currentTime': current_time_utc,
-            'redeemed': is_redeemed_db, # Current redeemed status (after potential update)
-            'redeemedTime': redeemed_time_db, # Current redeemed time (after potential update)
-            'actionTaken': action_taken # What action was taken by this Lambda call
-        }
-
-        return create_response(200, response_data, cors_headers)
-
-    except Exception as e:
-        print(f"Error during validation: {e}")
-        import traceback
-        traceback.print_exc()
-        return create_response(500, {'message': 'Internal server error.', 'valid': False, 'reason': 'Internal server error'}, cors_headers)
+        status_code, response_data = validate_single_ticket(body.get('verificationId'), current_time_utc)
+        return create_response(status_code, response_data, CORS_HEADERS)
+
+    except Exception:
+        logger.exception("Error during validation")
+        return create_response(500, {'message': 'Internal server error.', 'valid': False, 'reason': 'Internal server error'}, CORS_HEADERS)
 
 # --- Helper function to create a standardized Lambda proxy response ---
 def create_response(status_code, body_content, headers):
@@ -184,5 +335,5 @@ def create_response(status_code, body_content, headers):
     return {
         'statusCode': status_code,
         'headers': headers,
-        'body': json.dumps(body_dict, cls=DecimalEncoder)
+        'body': orjson.dumps(body_dict).decode()
     }
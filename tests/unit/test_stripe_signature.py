@@ -0,0 +1,99 @@
+import hashlib
+import hmac
+import importlib.util
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+# The module builds its AWS clients at import time; give them a region and keep the
+# warm-up read from probing instance metadata for credentials.
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
+os.environ.setdefault("AWS_EC2_METADATA_DISABLED", "true")
+
+_MODULE_PATH = Path(__file__).resolve().parents[2] / "src" / "handle_stripe_webhook" / "lambda_function.py"
+_spec = importlib.util.spec_from_file_location("handle_stripe_webhook", _MODULE_PATH)
+webhook = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(webhook)
+
+SECRET = "whsec_test_secret"
+PAYLOAD = '{"id": "evt_test", "type": "checkout.session.completed"}'
+
+
+def sign(payload, timestamp, secret=SECRET):
+    """Signs a payload the way Stripe does: HMAC-SHA256 over "<timestamp>.<payload>"."""
+    return hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+
+
+@pytest.fixture()
+def timestamp():
+    return int(time.time())
+
+
+@pytest.fixture()
+def sig_header(timestamp):
+    return f"t={timestamp},v1={sign(PAYLOAD, timestamp)}"
+
+
+def test_valid_signature(sig_header):
+    webhook.verify_stripe_signature(PAYLOAD, sig_header, SECRET)
+
+
+def test_tampered_body(sig_header):
+    tampered = PAYLOAD.replace("evt_test", "evt_forged")
+
+    with pytest.raises(ValueError, match="No signatures found"):
+        webhook.verify_stripe_signature(tampered, sig_header, SECRET)
+
+
+def test_wrong_secret(sig_header):
+    with pytest.raises(ValueError, match="No signatures found"):
+        webhook.verify_stripe_signature(PAYLOAD, sig_header, "whsec_other_secret")
+
+
+def test_stale_timestamp():
+    stale = int(time.time()) - webhook.SIGNATURE_TOLERANCE_SECONDS - 1
+    header = f"t={stale},v1={sign(PAYLOAD, stale)}"
+
+    with pytest.raises(ValueError, match="tolerance"):
+        webhook.verify_stripe_signature(PAYLOAD, header, SECRET)
+
+
+def test_multiple_v1_signatures_one_matching(timestamp):
+    # Stripe sends one v1 per active secret while a signing secret is being rolled
+    header = f"t={timestamp},v1={sign(PAYLOAD, timestamp, 'whsec_old_secret')},v1={sign(PAYLOAD, timestamp)}"
+
+    webhook.verify_stripe_signature(PAYLOAD, header, SECRET)
+
+
+def test_multiple_v1_signatures_none_matching(timestamp):
+    header = f"t={timestamp},v1={sign(PAYLOAD, timestamp, 'whsec_a')},v1={sign(PAYLOAD, timestamp, 'whsec_b')}"
+
+    with pytest.raises(ValueError, match="No signatures found"):
+        webhook.verify_stripe_signature(PAYLOAD, header, SECRET)
+
+
+def test_timestamp_is_part_of_the_signature(timestamp):
+    # Reusing a signature with a fresh t= must not pass
+    header = f"t={timestamp + 1},v1={sign(PAYLOAD, timestamp)}"
+
+    with pytest.raises(ValueError, match="No signatures found"):
+        webhook.verify_stripe_signature(PAYLOAD, header, SECRET)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        "",
+        "garbage",
+        "v1=abcdef",  # no timestamp
+        "t=1700000000",  # no v1 signature
+        "t=,v1=abcdef",
+        "t=not-a-number,v1=abcdef",
+        "t=1700000000,v0=abcdef",  # only the unsupported v0 scheme
+    ],
+)
+def test_malformed_header(header):
+    with pytest.raises(ValueError):
+        webhook.verify_stripe_signature(PAYLOAD, header, SECRET)